@@ -0,0 +1,173 @@
+import asyncio
+import time
+from collections import defaultdict
+
+# Pub/sub and lease primitives shared by backend nodes. LocalBus keeps
+# everything in-process (single node, tests); RedisBus spans several nodes.
+
+
+class LocalBus:
+    """In-process bus with the same interface as RedisBus"""
+
+    distributed = False
+
+    def __init__(self):
+        self._subs = defaultdict(list)
+        self._leases = {}
+        self._nodes = {}
+
+    async def publish(self, channel: str, data: bytes):
+        for callback in list(self._subs.get(channel, [])):
+            try:
+                await callback(data)
+            except Exception as e:
+                print(f"Error delivering message on {channel}: {e}")
+
+    async def subscribe(self, channel: str, callback):
+        self._subs[channel].append(callback)
+
+    async def unsubscribe(self, channel: str, callback):
+        if callback in self._subs.get(channel, []):
+            self._subs[channel].remove(callback)
+        if not self._subs.get(channel):
+            self._subs.pop(channel, None)
+
+    async def subscriber_counts(self, channels):
+        return {c: len(self._subs.get(c, [])) for c in channels}
+
+    async def acquire(self, key: str, owner: str, ttl: float):
+        """Take or renew a lease; returns True if ``owner`` holds it"""
+        now = time.time()
+        held = self._leases.get(key)
+        if held is None or held[0] == owner or held[1] < now:
+            self._leases[key] = (owner, now + ttl)
+            return True
+        return False
+
+    async def release(self, key: str, owner: str):
+        held = self._leases.get(key)
+        if held and held[0] == owner:
+            del self._leases[key]
+
+    async def heartbeat(self, node_id: str, ttl: float):
+        self._nodes[node_id] = time.time() + ttl
+
+    async def live_nodes(self):
+        now = time.time()
+        return [n for n, expires in self._nodes.items() if expires >= now]
+
+    async def close(self):
+        self._subs.clear()
+
+
+_ACQUIRE = """
+local cur = redis.call('GET', KEYS[1])
+if cur == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not cur then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBus:
+    """Bus backed by Redis pub/sub and expiring keys"""
+
+    distributed = True
+
+    def __init__(self, url: str, prefix: str = "cyber"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._pubsub = self._redis.pubsub()
+        self._prefix = prefix
+        self._subs = defaultdict(list)
+        self._reader = None
+        self._acquire = self._redis.register_script(_ACQUIRE)
+        self._release = self._redis.register_script(_RELEASE)
+
+    def _key(self, name: str):
+        return f"{self._prefix}:{name}"
+
+    async def publish(self, channel: str, data: bytes):
+        await self._redis.publish(self._key(channel), data)
+
+    async def subscribe(self, channel: str, callback):
+        first = not self._subs[channel]
+        self._subs[channel].append(callback)
+        if first:
+            await self._pubsub.subscribe(self._key(channel))
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, channel: str, callback):
+        if callback in self._subs.get(channel, []):
+            self._subs[channel].remove(callback)
+        if channel in self._subs and not self._subs[channel]:
+            del self._subs[channel]
+            await self._pubsub.unsubscribe(self._key(channel))
+
+    async def _read(self):
+        strip = len(self._prefix) + 1
+        while True:
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                print(f"Bus read error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not msg:
+                continue
+            channel = msg["channel"].decode()[strip:]
+            for callback in list(self._subs.get(channel, [])):
+                try:
+                    await callback(msg["data"])
+                except Exception as e:
+                    print(f"Error delivering message on {channel}: {e}")
+
+    async def subscriber_counts(self, channels):
+        channels = list(channels)
+        if not channels:
+            return {}
+        counts = await self._redis.pubsub_numsub(*[self._key(c) for c in channels])
+        return {c: int(n) for c, (_, n) in zip(channels, counts)}
+
+    async def acquire(self, key: str, owner: str, ttl: float):
+        """Take or renew a lease; returns True if ``owner`` holds it"""
+        held = await self._acquire(keys=[self._key(f"lease:{key}")], args=[owner, int(ttl * 1000)])
+        return bool(held)
+
+    async def release(self, key: str, owner: str):
+        await self._release(keys=[self._key(f"lease:{key}")], args=[owner])
+
+    async def heartbeat(self, node_id: str, ttl: float):
+        await self._redis.set(self._key(f"node:{node_id}"), b"1", px=int(ttl * 1000))
+
+    async def live_nodes(self):
+        match = self._key("node:*")
+        strip = len(self._key("node:"))
+        return [k.decode()[strip:] async for k in self._redis.scan_iter(match=match)]
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        await self._pubsub.close()
+        await self._redis.close()
+
+
+def create_bus(url: str = ""):
+    """RedisBus for a redis:// url, otherwise an in-process LocalBus"""
+    if url:
+        return RedisBus(url)
+    return LocalBus()
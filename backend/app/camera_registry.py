@@ -0,0 +1,124 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from .db import get_all_cameras, normalize_camera
+from .mjpeg import viewer_count
+
+# In-process camera registry, loaded once at startup and kept in sync by add_camera
+_cameras: Dict[str, dict] = {}
+_lock = threading.Lock()
+_version = 0
+# When the registry was last loaded from the database, None until it succeeds
+loaded_at = None
+
+# Last rendered payload, reused until the registry or a coarse status changes
+_rendered = (None, b"[]", None)
+
+# A running camera with no frame for this long is reported as stale
+STALE_SECONDS = 5.0
+FPS_BUCKET = 5
+
+
+def camera_key(cam: dict):
+    """Resolve the id a camera is registered (and streamed) under"""
+    return str(cam.get("id", cam.get("name", "unknown")))
+
+
+def load():
+    """Populate the registry from the database.
+
+    Safe to call repeatedly; the cached payload is only invalidated when the
+    stored cameras actually changed.
+    """
+    global _version, loaded_at
+    cameras = {camera_key(cam): cam for cam in (get_all_cameras() or [])}
+    with _lock:
+        if cameras != _cameras:
+            _version += 1
+            _cameras.clear()
+            _cameras.update(cameras)
+        loaded_at = time.time()
+    return len(cameras)
+
+
+def upsert(camera: dict):
+    """Add or replace a camera record"""
+    global _version
+    cam = normalize_camera(dict(camera))
+    with _lock:
+        _version += 1
+        _cameras[camera_key(cam)] = cam
+    return cam
+
+
+def get(camera_id: str) -> Optional[dict]:
+    with _lock:
+        cam = _cameras.get(camera_id)
+        return dict(cam) if cam else None
+
+
+def all_cameras():
+    with _lock:
+        return [dict(cam) for cam in _cameras.values()]
+
+
+def worker_status(camera_id: str, worker, node: str = None):
+    """Coarse live status for a camera.
+
+    Only fields that change on real state changes are reported (fps is bucketed
+    and frame times are reduced to a stale flag), so polling gets a stable ETag.
+    """
+    status = {
+        "running": False,
+        "stale": False,
+        "fps": 0,
+        "viewers": viewer_count(camera_id),
+        "node": node if worker is not None else None,
+    }
+    if worker is not None:
+        status["running"] = bool(worker.running and worker.is_alive())
+        status["stale"] = status["running"] and (
+            not worker.last_frame_at or time.time() - worker.last_frame_at > STALE_SECONDS
+        )
+        status["fps"] = int(round(worker.fps / FPS_BUCKET)) * FPS_BUCKET
+    return status
+
+
+def render(workers: Dict, remote_status: Dict = None, node: str = None,
+           remote_viewers: Dict = None) -> Tuple[bytes, str]:
+    """Serialize the registry merged with live worker status.
+
+    Cameras run by other nodes take their status from ``remote_status``.
+    Viewer counts add up this node's clients and ``remote_viewers`` from others.
+    Returns the JSON body and a weak ETag; both are cached and only rebuilt
+    when the registry or a camera's coarse status changes.
+    """
+    remote_status = remote_status or {}
+    remote_viewers = remote_viewers or {}
+    with _lock:
+        version = _version
+        items = list(_cameras.items())
+
+    statuses = []
+    for cam_id, _ in items:
+        worker = workers.get(cam_id)
+        if worker is None and cam_id in remote_status:
+            status = dict(remote_status[cam_id])
+        else:
+            status = worker_status(cam_id, worker, node)
+        status["viewers"] = viewer_count(cam_id) + remote_viewers.get(cam_id, 0)
+        statuses.append(status)
+
+    global _rendered
+    key = (version, statuses)
+    cached_key, cached_body, cached_etag = _rendered
+    if cached_key == key:
+        return cached_body, cached_etag
+
+    payload = [dict(cam, status=status) for (_, cam), status in zip(items, statuses)]
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    etag = 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+    _rendered = (key, body, etag)
+    return body, etag
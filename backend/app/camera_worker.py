@@ -2,10 +2,14 @@ import cv2
 import threading
 import numpy as np
 import os
+import json
+import time
 from datetime import datetime
-from .face import detect_faces
+from .face import detect_faces, face_quality
 from .db import get_all_persons, insert_detection
-from .mjpeg import update_frame
+from .mjpeg import update_frame, update_overlay
+from . import recorder
+from . import cluster
 from .config import settings
 
 def cosine_distance(emb1, emb2):
@@ -20,13 +24,16 @@ def cosine_distance(emb1, emb2):
     cosine_sim = dot_product / (norm1 * norm2)
     return 1.0 - cosine_sim
 
-def save_snapshot(frame, camera_id, person_name):
-    """Save detection snapshot"""
+def save_snapshot(frame, camera_id, person_name, boxes=None):
+    """Save a clean detection snapshot, with its overlay boxes in a JSON sidecar"""
     os.makedirs("snapshots", exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     filename = f"{camera_id}_{person_name}_{timestamp}.jpg"
     filepath = os.path.join("snapshots", filename)
     cv2.imwrite(filepath, frame)
+    if boxes:
+        with open(filepath + ".json", "w") as fh:
+            json.dump({"boxes": boxes}, fh)
     return filename
 
 class CameraWorker(threading.Thread):
@@ -37,6 +44,41 @@ class CameraWorker(threading.Thread):
         self.running = True
         self.alert_callback = alert_callback
         self.frame_count = 0
+        self.fps = 0.0
+        self.last_frame_at = None
+        self._tracks = {}
+
+    def _track_fps(self):
+        """Update a smoothed capture FPS from the interval since the last frame"""
+        now = time.time()
+        if self.last_frame_at:
+            dt = now - self.last_frame_at
+            if dt > 0:
+                inst = 1.0 / dt
+                self.fps = inst if self.fps == 0 else 0.9 * self.fps + 0.1 * inst
+        self.last_frame_at = now
+
+    def _update_track(self, person, frame, quality, boxes=None):
+        """Keep the best quality snapshot for a person's current track"""
+        now = time.time()
+        ttl = settings.track_ttl_seconds
+        for key in [k for k, t in self._tracks.items() if now - t["last_seen"] > ttl]:
+            del self._tracks[key]
+
+        track = self._tracks.get(person["id"])
+        if track is None:
+            track = {
+                "id": f"{self.cam_id}-{person['id']}-{int(now)}",
+                "score": -1.0,
+                "snapshot": None,
+            }
+            self._tracks[person["id"]] = track
+        track["last_seen"] = now
+
+        if quality["score"] > track["score"]:
+            track["score"] = quality["score"]
+            track["snapshot"] = save_snapshot(frame, self.cam_id, person["name"], boxes)
+        return track
 
     def run(self):
         cap = cv2.VideoCapture(self.url)
@@ -47,13 +89,14 @@ class CameraWorker(threading.Thread):
         while self.running:
             ret, frame = cap.read()
             if not ret:
-                import time
                 time.sleep(1)
                 continue
 
             self.frame_count += 1
-            # Update MJPEG stream
-            update_frame(self.cam_id, frame)
+            self._track_fps()
+            # Update MJPEG stream and the pre-event buffer with the same JPEG
+            recorder.push_frame(self.cam_id, update_frame(self.cam_id, frame))
+            cluster.publish_frame(self.cam_id)
 
             # Process every 10th frame for performance
             if self.frame_count % 10 != 0:
@@ -61,10 +104,13 @@ class CameraWorker(threading.Thread):
 
             try:
                 faces = detect_faces(frame)
-                persons = get_all_persons()
+                persons = None
+                # Annotations are kept as metadata; the frame itself stays clean
+                boxes = []
 
                 for f in faces:
-                    emb = f.embedding.tolist()
+                    quality = face_quality(frame, f)
+
                     # Get bounding box if available
                     bbox = None
                     if hasattr(f, 'bbox') and f.bbox is not None:
@@ -72,9 +118,18 @@ class CameraWorker(threading.Thread):
                     elif hasattr(f, 'det_bbox'):
                         bbox = f.det_bbox.astype(int)
 
-                    # Draw bounding box on frame if available
+                    box = None
                     if bbox is not None and len(bbox) >= 4:
-                        cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
+                        box = {"bbox": [int(v) for v in bbox[:4]], "label": None}
+                        boxes.append(box)
+
+                    # Low quality faces are never matched
+                    if not quality["ok"]:
+                        continue
+
+                    if persons is None:
+                        persons = get_all_persons()
+                    emb = f.embedding.tolist()
 
                     # Compare with database
                     best_match = None
@@ -89,15 +144,21 @@ class CameraWorker(threading.Thread):
                             best_match = p
 
                     if best_match:
-                        # Save snapshot
-                        snapshot_file = save_snapshot(frame, self.cam_id, best_match["name"])
+                        if box is not None:
+                            box["label"] = best_match["name"]
+
+                        # Best quality snapshot seen on this track
+                        track = self._update_track(best_match, frame, quality, [box] if box else None)
+                        snapshot_file = track["snapshot"]
+                        clip_file = recorder.request_clip(self.cam_id)
                         
                         # Insert detection
                         insert_detection(
                             best_match["id"], 
                             self.cam_id,
                             float(best_dist),
-                            snapshot_file
+                            snapshot_file,
+                            clip_file
                         )
 
                         # Send alert via callback
@@ -108,7 +169,9 @@ class CameraWorker(threading.Thread):
                                 "person": {"name": best_match["name"], "id": best_match["id"]},
                                 "confidence": float(best_dist),
                                 "snapshot": snapshot_file,
-                                "track_id": None
+                                "clip": clip_file,
+                                "track_id": track["id"],
+                                "quality": round(quality["score"], 3)
                             }
                             # Run async callback in event loop
                             import asyncio
@@ -128,22 +191,11 @@ class CameraWorker(threading.Thread):
                                 # Fallback if event loop issues
                                 pass
 
-                        # Draw name on frame if bbox is available
-                        if bbox is not None and len(bbox) >= 4:
-                            cv2.putText(
-                                frame, 
-                                best_match["name"], 
-                                (bbox[0], max(bbox[1] - 10, 20)),
-                                cv2.FONT_HERSHEY_SIMPLEX, 
-                                0.7, 
-                                (0, 255, 0), 
-                                2
-                            )
-
-                # Update frame with annotations
-                update_frame(self.cam_id, frame)
+                update_overlay(self.cam_id, boxes, frame)
+                cluster.publish_overlay(self.cam_id)
 
             except Exception as e:
                 print(f"Error processing frame for {self.cam_id}: {e}")
 
         cap.release()
+        recorder.drop_camera(self.cam_id)
@@ -0,0 +1,366 @@
+import asyncio
+import json
+import math
+import random
+import socket
+import time
+from collections import defaultdict
+from .config import settings
+from .bus import create_bus
+from . import camera_registry
+from . import mjpeg
+from .mjpeg import latest_frame, annotated_frame, mjpeg_stream_generator
+
+# Node-aware camera ownership and cross-node routing.
+#
+# Every node heartbeats on the bus and holds an expiring lease per camera it
+# runs. A node claims up to its fair share of cameras, sheds extras when new
+# nodes join, and picks up cameras of dead nodes once their leases expire.
+# Frames and overlays are relayed only while another node has viewers for
+# them; alerts and camera additions are broadcast to every node.
+
+node_id = settings.node_id or socket.gethostname()
+bus = None
+
+_loop = None
+_kick = None
+_task = None
+_hooks = {}
+_workers = {}
+
+_owned = set()
+_renewed = {}
+_in_flight = set()
+_shed = {}
+_wanted = set()
+_wanted_overlays = set()
+_node_status = {}
+
+_remote_data = {}
+_watchers = defaultdict(int)
+_watch_callbacks = {}
+
+
+def frame_channel(camera_id: str, annotated: bool):
+    return f"frames:{camera_id}:{'annotated' if annotated else 'raw'}"
+
+
+def overlay_channel(camera_id: str):
+    return f"overlays:{camera_id}"
+
+
+async def start(workers, start_camera, stop_camera, deliver_alert):
+    """Connect to the bus and start the lease loop.
+
+    ``start_camera(cam)`` and ``stop_camera(camera_id)`` are called as this node
+    gains and loses camera leases (``start_camera`` returns False if it cannot
+    start the camera yet); ``deliver_alert(alert)`` fans an alert out to
+    this node's websocket clients.
+    """
+    global bus, _loop, _kick, _task, _workers
+    bus = create_bus(settings.cluster_url)
+    _loop = asyncio.get_running_loop()
+    _kick = asyncio.Event()
+    _workers = workers
+    _hooks.update(start_camera=start_camera, stop_camera=stop_camera, deliver_alert=deliver_alert)
+
+    await bus.subscribe("alerts", _on_alert)
+    await bus.subscribe("cameras", _on_camera)
+    await bus.subscribe("watch", _on_watch)
+    if bus.distributed:
+        await bus.subscribe("status", _on_status)
+    _task = asyncio.create_task(_lease_loop())
+    print(f"Node {node_id} started ({'distributed' if bus.distributed else 'single node'})")
+
+
+async def stop():
+    """Stop owned cameras and hand their leases back"""
+    if _task:
+        _task.cancel()
+    for camera_id in list(_owned):
+        _drop(camera_id)
+        await bus.release(camera_id, node_id)
+    if bus:
+        await bus.close()
+
+
+def publish(channel: str, payload: bytes, drop_if_busy: bool = False):
+    """Publish on the bus; safe to call from worker threads and other event loops.
+
+    With ``drop_if_busy`` at most one publish per channel is in flight and newer
+    payloads are dropped meanwhile, so a slow bus cannot queue up frames.
+    """
+    if bus is None or _loop is None:
+        return
+    if drop_if_busy:
+        if channel in _in_flight:
+            return
+        _in_flight.add(channel)
+    future = asyncio.run_coroutine_threadsafe(bus.publish(channel, payload), _loop)
+    future.add_done_callback(lambda f: _published(channel, f, drop_if_busy))
+
+
+def _published(channel: str, future, drop_if_busy: bool):
+    if drop_if_busy:
+        # Frames are best effort; the next one supersedes a failed publish
+        _in_flight.discard(channel)
+        return
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Publish on {channel} failed: {future.exception()}")
+
+
+def kick():
+    """Run a lease pass now instead of waiting for the next interval"""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_kick.set)
+
+
+def is_local(camera_id: str):
+    """Whether this node should serve a camera's stream from its own frames"""
+    return bus is None or not bus.distributed or camera_id in _owned
+
+
+def publish_alert(alert_data: dict):
+    publish("alerts", json.dumps(alert_data, default=str).encode())
+
+
+def publish_camera(camera: dict):
+    publish("cameras", json.dumps(camera, default=str).encode())
+
+
+def publish_frame(camera_id: str):
+    """Relay the latest frame to nodes that are streaming this camera"""
+    if (camera_id, False) in _wanted:
+        frame = latest_frame(camera_id)
+        if frame:
+            publish(frame_channel(camera_id, False), frame, drop_if_busy=True)
+    if (camera_id, True) in _wanted:
+        frame = annotated_frame(camera_id)
+        if frame:
+            publish(frame_channel(camera_id, True), frame, drop_if_busy=True)
+
+
+def publish_overlay(camera_id: str):
+    """Relay the camera's current overlay to nodes serving /ws/overlays for it"""
+    if camera_id in _wanted_overlays:
+        overlay = mjpeg.get_overlay(camera_id)
+        if overlay:
+            publish(overlay_channel(camera_id), json.dumps(overlay).encode(), drop_if_busy=True)
+
+
+def _live_reports():
+    now = time.time()
+    return [r for r in _node_status.values() if now - r["at"] <= settings.lease_ttl_seconds]
+
+
+def remote_status():
+    """Camera status reported by other live nodes"""
+    merged = {}
+    for report in _live_reports():
+        merged.update(report["cameras"])
+    return merged
+
+
+def remote_viewers():
+    """Viewers per camera streaming from other live nodes"""
+    totals = defaultdict(int)
+    for report in _live_reports():
+        for camera_id, n in report["viewers"].items():
+            totals[camera_id] += n
+    return dict(totals)
+
+
+async def _watch(channel: str, camera_id: str):
+    """Share one bus subscription to ``channel`` among this node's viewers.
+
+    The slot is reserved before anything is awaited, so concurrent viewers
+    cannot both subscribe; only the first one does.
+    """
+    _watchers[channel] += 1
+    if _watchers[channel] == 1:
+        async def on_data(data):
+            _remote_data[channel] = (time.time(), data)
+        _watch_callbacks[channel] = on_data
+        await bus.subscribe(channel, on_data)
+    # Let the owner start relaying without waiting for its next lease pass
+    await bus.publish("watch", camera_id.encode())
+
+
+async def _unwatch(channel: str):
+    _watchers[channel] -= 1
+    if _watchers[channel] == 0:
+        del _watchers[channel]
+        _remote_data.pop(channel, None)
+        await bus.unsubscribe(channel, _watch_callbacks.pop(channel))
+
+
+def _remote_payload(channel: str):
+    entry = _remote_data.get(channel)
+    return entry[1] if entry else None
+
+
+async def watch_overlays(camera_id: str):
+    """Start receiving overlays for a camera owned by another node"""
+    await _watch(overlay_channel(camera_id), camera_id)
+
+
+async def unwatch_overlays(camera_id: str):
+    await _unwatch(overlay_channel(camera_id))
+
+
+def remote_overlay(camera_id: str):
+    """Latest relayed overlay, or None once older than overlay_ttl_seconds"""
+    entry = _remote_data.get(overlay_channel(camera_id))
+    if entry is None or time.time() - entry[0] > settings.overlay_ttl_seconds:
+        return None
+    return json.loads(entry[1])
+
+
+async def remote_stream(camera_id: str, annotated: bool):
+    """MJPEG stream for a camera owned by another node.
+
+    One bus subscription per camera is shared by all viewers on this node.
+    """
+    channel = frame_channel(camera_id, annotated)
+    try:
+        await _watch(channel, camera_id)
+        async for chunk in mjpeg_stream_generator(camera_id, annotated, source=lambda: _remote_payload(channel)):
+            yield chunk
+    finally:
+        await _unwatch(channel)
+
+
+async def _on_alert(data):
+    await _hooks["deliver_alert"](json.loads(data))
+
+
+async def _on_camera(data):
+    camera_registry.upsert(json.loads(data))
+    _kick.set()
+
+
+async def _on_watch(data):
+    if data.decode() in _owned:
+        _kick.set()
+
+
+async def _on_status(data):
+    report = json.loads(data)
+    if report["node"] != node_id:
+        _node_status[report["node"]] = {
+            "at": time.time(),
+            "cameras": report["cameras"],
+            "viewers": report.get("viewers", {}),
+        }
+
+
+def _drop(camera_id: str):
+    _owned.discard(camera_id)
+    _renewed.pop(camera_id, None)
+    _hooks["stop_camera"](camera_id)
+
+
+def _expire_unrenewed():
+    """Stop cameras whose lease could not be renewed in time.
+
+    Runs even when the bus is unreachable. The deadline is one interval short of
+    the lease TTL so the worker stops before another node can claim the camera.
+    """
+    ttl = settings.lease_ttl_seconds
+    deadline = max(ttl - settings.lease_interval_seconds, ttl / 2)
+    now = time.time()
+    for camera_id in [c for c in _owned if now - _renewed.get(c, 0) > deadline]:
+        print(f"Lease on {camera_id} not renewed; stopping it on {node_id}")
+        _drop(camera_id)
+
+
+async def _refresh_registry():
+    """Load cameras from the database until it succeeds, then every camera_refresh_seconds"""
+    loaded_at = camera_registry.loaded_at
+    if loaded_at and time.time() - loaded_at < settings.camera_refresh_seconds:
+        return
+    try:
+        await asyncio.to_thread(camera_registry.load)
+    except Exception as e:
+        print(f"Error loading cameras on {node_id}: {e}")
+
+
+async def _lease_loop():
+    while True:
+        await _refresh_registry()
+        try:
+            await _rebalance()
+        except Exception as e:
+            print(f"Lease pass failed on {node_id}: {e}")
+        _expire_unrenewed()
+        try:
+            await asyncio.wait_for(_kick.wait(), settings.lease_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        _kick.clear()
+
+
+async def _rebalance():
+    ttl = settings.lease_ttl_seconds
+    now = time.time()
+    await bus.heartbeat(node_id, ttl)
+
+    cameras = {}
+    for cam in camera_registry.all_cameras():
+        if cam.get("url") or cam.get("rtsp_url"):
+            cameras[camera_registry.camera_key(cam)] = cam
+    nodes = await bus.live_nodes()
+    share = math.ceil(len(cameras) / max(len(nodes), 1))
+
+    # Renew held leases; stop cameras whose lease was lost
+    for camera_id in list(_owned):
+        if camera_id not in cameras or not await bus.acquire(camera_id, node_id, ttl):
+            _drop(camera_id)
+        else:
+            _renewed[camera_id] = time.time()
+
+    # Shed one camera per pass while over our share so joining nodes get work
+    if len(_owned) > share:
+        camera_id = next(iter(_owned))
+        _drop(camera_id)
+        await bus.release(camera_id, node_id)
+        _shed[camera_id] = now
+
+    # Claim free cameras, including those whose owner's lease has expired
+    for camera_id in [c for c, at in _shed.items() if now - at > ttl]:
+        del _shed[camera_id]
+    candidates = [c for c in cameras if c not in _owned and c not in _shed]
+    random.shuffle(candidates)
+    for camera_id in candidates:
+        if len(_owned) >= share:
+            break
+        if await bus.acquire(camera_id, node_id, ttl):
+            # start_camera refuses while a previous worker for the camera is still exiting
+            if _hooks["start_camera"](cameras[camera_id]):
+                _owned.add(camera_id)
+                _renewed[camera_id] = time.time()
+            else:
+                await bus.release(camera_id, node_id)
+
+    if bus.distributed:
+        await _refresh_wanted()
+        await _publish_status()
+
+
+async def _refresh_wanted():
+    global _wanted, _wanted_overlays
+    overlay_counts = await bus.subscriber_counts([overlay_channel(c) for c in _owned])
+    _wanted_overlays = {c for c in _owned if overlay_counts.get(overlay_channel(c), 0) > 0}
+    keys = [(c, a) for c in _owned for a in (False, True)]
+    counts = await bus.subscriber_counts([frame_channel(c, a) for c, a in keys])
+    _wanted = {k for k in keys if counts.get(frame_channel(*k), 0) > 0}
+    mjpeg.remote_annotated = {c for c, a in _wanted if a}
+
+
+async def _publish_status():
+    cameras = {
+        camera_id: camera_registry.worker_status(camera_id, _workers.get(camera_id), node_id)
+        for camera_id in _owned
+    }
+    report = {"node": node_id, "cameras": cameras, "viewers": mjpeg.viewer_counts()}
+    await bus.publish("status", json.dumps(report).encode())
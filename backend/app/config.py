@@ -37,6 +37,40 @@ class Settings(BaseSettings):
     # Recognition
     similarity_threshold: float = 0.36
 
+    # Face quality gate (faces below these are not matched)
+    face_min_size: int = 40
+    face_min_det_score: float = 0.6
+    face_min_sharpness: float = 40.0
+    face_max_yaw: float = 45.0
+    face_max_pitch: float = 35.0
+    face_min_quality: float = 0.35
+    enroll_min_quality: float = 0.6
+
+    # Seconds a matched person keeps the same track on a camera
+    track_ttl_seconds: float = 5.0
+
+    # Seconds /ws/overlays keeps reporting boxes after the last processed frame
+    overlay_ttl_seconds: float = 1.0
+
+    # Multi-node deployment. Without cluster_url a single node uses an in-process bus.
+    node_id: str = ""
+    cluster_url: str = ""
+    lease_ttl_seconds: float = 10.0
+    lease_interval_seconds: float = 3.0
+    # How often the camera registry is reloaded from the database
+    camera_refresh_seconds: float = 30.0
+
+    # Event clip recording
+    recording_enabled: bool = True
+    recording_pre_seconds: float = 5.0
+    recording_post_seconds: float = 5.0
+    recording_max_clip_seconds: float = 30.0
+    recording_fps: float = 10.0
+    recording_memory_mb: int = 512  # pre-event buffer budget shared by all cameras
+    recording_dir: str = "clips"
+    recording_retention_hours: float = 72.0
+    recording_max_disk_mb: int = 10240
+
     # Admin Login
     admin_email: str = "admin@cyber.com"
     admin_password: str = "admin123"
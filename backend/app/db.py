@@ -52,29 +52,37 @@ def insert_camera(name: str, url: str, camera_id: str = None):
         "location": name
     }).execute()
 
+def normalize_camera(camera: dict):
+    """Map database fields to frontend expected fields"""
+    # Map rtsp_url to url for frontend compatibility
+    if "rtsp_url" in camera:
+        camera["url"] = camera["rtsp_url"]
+    # Map location to name if name is not set
+    if "location" in camera and camera["location"]:
+        if "name" not in camera or not camera["name"]:
+            camera["name"] = camera["location"]
+    return camera
+
 def get_all_cameras():
     r = supabase.table("cameras").select("*").execute()
-    # Map database fields to frontend expected fields
     if r.data:
         for camera in r.data:
-            # Map rtsp_url to url for frontend compatibility
-            if "rtsp_url" in camera:
-                camera["url"] = camera["rtsp_url"]
-            # Map location to name if name is not set
-            if "location" in camera and camera["location"]:
-                if "name" not in camera or not camera["name"]:
-                    camera["name"] = camera["location"]
+            normalize_camera(camera)
     return r.data
 
 # ---------------------- DETECTIONS TABLE ----------------------
 
-def insert_detection(person_id, camera_id, confidence, snapshot_url):
+def insert_detection(person_id, camera_id, confidence, snapshot_url, clip_path=None):
     # Database uses snapshot_path instead of snapshot_url
     from datetime import datetime
-    supabase.table("detections").insert({
+    row = {
         "person_id": person_id,
         "camera_id": camera_id,
         "confidence": float(confidence),
         "snapshot_path": snapshot_url,
         "timestamp": datetime.utcnow().isoformat()
-    }).execute()
+    }
+    # Only sent when recording, so schemas without clip_path keep working
+    if clip_path:
+        row["clip_path"] = clip_path
+    supabase.table("detections").insert(row).execute()
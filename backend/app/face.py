@@ -1,15 +1,104 @@
 import cv2
 from insightface.app import FaceAnalysis
+from .config import settings
 
 face_app = FaceAnalysis(name="buffalo_l")
 face_app.prepare(ctx_id=0, det_size=(640, 640))
 
 
+def _face_sharpness(image, bbox):
+    """Variance of the Laplacian over the face crop, resized so scores are comparable"""
+    h, w = image.shape[:2]
+    x1, y1 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+    x2, y2 = min(int(bbox[2]), w), min(int(bbox[3]), h)
+    if x2 <= x1 or y2 <= y1:
+        return 0.0
+    crop = cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    crop = cv2.resize(crop, (112, 112))
+    return float(cv2.Laplacian(crop, cv2.CV_64F).var())
+
+
+def _face_pose(face):
+    """Return (yaw, pitch) in degrees.
+
+    Uses the 3D landmark pose when the model pack provides it, otherwise
+    estimates yaw from where the nose sits between the eyes.
+    """
+    pose = getattr(face, "pose", None)
+    if pose is not None and len(pose) >= 2:
+        return abs(float(pose[1])), abs(float(pose[0]))
+
+    kps = getattr(face, "kps", None)
+    if kps is None or len(kps) < 3:
+        return 0.0, 0.0
+    left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+    span = float(right_eye[0] - left_eye[0])
+    if span <= 0:
+        return 90.0, 0.0
+    ratio = (float(nose[0]) - float(left_eye[0])) / span
+    return min(abs(ratio - 0.5) * 180.0, 90.0), 0.0
+
+
+def face_quality(image, face):
+    """Score a detected face on size, detector score, blur and pose.
+
+    Returns a dict with the overall ``score`` in [0, 1], ``ok`` when the face
+    passes every gate and ``reason`` naming the first gate it failed.
+    """
+    bbox = face.bbox
+    min_side = float(min(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    det_score = float(getattr(face, "det_score", 1.0))
+    sharpness = _face_sharpness(image, bbox)
+    yaw, pitch = _face_pose(face)
+
+    reason = None
+    if min_side < settings.face_min_size:
+        reason = "too small"
+    elif det_score < settings.face_min_det_score:
+        reason = "low detector score"
+    elif sharpness < settings.face_min_sharpness:
+        reason = "blurry"
+    elif yaw > settings.face_max_yaw or pitch > settings.face_max_pitch:
+        reason = "not frontal"
+
+    size_score = min(min_side / (2.0 * settings.face_min_size), 1.0)
+    sharp_score = min(sharpness / (4.0 * settings.face_min_sharpness), 1.0)
+    pose_score = max(1.0 - max(yaw, pitch) / 90.0, 0.0)
+    score = (size_score * det_score * sharp_score * pose_score) ** 0.25
+
+    if reason is None and score < settings.face_min_quality:
+        reason = "low quality"
+
+    return {"score": score, "ok": reason is None, "reason": reason}
+
+
+def best_face(image, faces):
+    """Return (face, quality) for the highest quality face, or (None, None).
+
+    Faces that pass every gate win over ones that fail, whatever their score.
+    """
+    best, best_q = None, None
+    for f in faces:
+        q = face_quality(image, f)
+        if best_q is None or (q["ok"], q["score"]) > (best_q["ok"], best_q["score"]):
+            best, best_q = f, q
+    return best, best_q
+
+
 def extract_face_embedding(image):
+    """Embedding of the best face in an enrollment photo.
+
+    Returns None when no face is found and raises ValueError when the best
+    face is not good enough to enroll.
+    """
     faces = face_app.get(image)
     if len(faces) == 0:
         return None
-    return faces[0].embedding.tolist()
+    face, quality = best_face(image, faces)
+    if not quality["ok"] or quality["score"] < settings.enroll_min_quality:
+        reason = quality["reason"] or "low quality"
+        raise ValueError(f"Face quality too low for enrollment: {reason}")
+    return face.embedding.tolist()
 
 
 def detect_faces(image):
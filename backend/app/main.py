@@ -1,13 +1,16 @@
-from fastapi import FastAPI, UploadFile, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, Depends, HTTPException, WebSocket, WebSocketDisconnect, Request, Response
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from .config import settings
 from .db import *
 from .face import extract_face_embedding
-from .mjpeg import mjpeg_stream_generator, update_frame
+from .mjpeg import mjpeg_stream_generator, update_frame, get_overlay, draw_overlay
 from .utils import create_jwt_token, verify_password, hash_password, verify_jwt_token
 from .camera_worker import CameraWorker
+from . import camera_registry
+from . import cluster
+from . import recorder
 from .models import Token
 import cv2
 import numpy as np
@@ -32,11 +35,18 @@ security = HTTPBearer()
 # Store active camera workers
 active_workers: Dict[str, CameraWorker] = {}
 
+# Workers told to stop that may not have exited yet
+stopping_workers: Dict[str, CameraWorker] = {}
+
 # Store WebSocket connections
 websocket_connections: List[WebSocket] = []
 
-# Broadcast alert to all connected WebSocket clients
+# Broadcast alert to every node; each node forwards it to its own WebSocket clients
 async def broadcast_alert(alert_data: dict):
+    cluster.publish_alert(alert_data)
+
+# Send alert to the WebSocket clients connected to this node
+async def deliver_alert(alert_data: dict):
     disconnected = []
     for ws in websocket_connections:
         try:
@@ -143,12 +153,15 @@ async def websocket_alerts(websocket: WebSocket):
 
 @app.get("/api/cameras")
 @app.get("/cameras")
-def get_cameras():
-    try:
-        cameras = get_all_cameras()
-        return cameras or []
-    except Exception as e:
-        return []
+def get_cameras(request: Request):
+    # Served from the in-memory registry; clients poll with If-None-Match
+    body, etag = camera_registry.render(
+        active_workers, cluster.remote_status(), cluster.node_id, cluster.remote_viewers()
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/api/cameras")
 def add_camera(data: dict):
@@ -161,32 +174,90 @@ def add_camera(data: dict):
     
     # Insert camera with cam_id as TEXT primary key
     insert_camera(name, url, cam_id)
+    camera = camera_registry.upsert({"id": cam_id, "rtsp_url": url, "location": name})
     
-    # Start camera worker
-    if cam_id not in active_workers:
-        worker = CameraWorker(cam_id, url, broadcast_alert)
-        active_workers[cam_id] = worker
-        worker.start()
+    # Announce to every node; whichever claims the lease starts the worker
+    cluster.publish_camera(camera)
+    cluster.kick()
     
     return {"message": "Camera added", "id": cam_id}
 
 # ---------------- STREAM ENDPOINT ------------------
 
 @app.get("/stream/{camera_id}")
-async def camera_stream(camera_id: str):
+async def camera_stream(camera_id: str, annotated: bool = False):
+    # Raw frames by default; clients draw boxes from /ws/overlays. annotated=true
+    # draws them server-side on the frames they were detected on.
+    if cluster.is_local(camera_id):
+        stream = mjpeg_stream_generator(camera_id, annotated)
+    else:
+        stream = cluster.remote_stream(camera_id, annotated)
     return StreamingResponse(
-        mjpeg_stream_generator(camera_id),
+        stream,
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+@app.websocket("/ws/overlays/{camera_id}")
+async def websocket_overlays(websocket: WebSocket, camera_id: str):
+    """Push annotation boxes for a camera as JSON whenever they change"""
+    await websocket.accept()
+    # Reading in the background is how a disconnect is noticed while idle
+    receiver = asyncio.create_task(websocket.receive_text())
+    last_version = None
+    # Overlays of cameras owned by another node are relayed over the bus
+    remote = not cluster.is_local(camera_id)
+    try:
+        if remote:
+            await cluster.watch_overlays(camera_id)
+        while True:
+            if receiver.done():
+                receiver.result()  # raises WebSocketDisconnect once the client is gone
+                receiver = asyncio.create_task(websocket.receive_text())
+            overlay = cluster.remote_overlay(camera_id) if remote else get_overlay(camera_id)
+            version = overlay["version"] if overlay else None
+            if version != last_version:
+                await websocket.send_json({
+                    "type": "overlay",
+                    "data": overlay or {"camera_id": camera_id, "boxes": []}
+                })
+                last_version = version
+            await asyncio.sleep(0.1)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Overlay socket for {camera_id} closed: {e}")
+    finally:
+        receiver.cancel()
+        if remote:
+            await cluster.unwatch_overlays(camera_id)
+
 @app.get("/snapshots/{filename}")
-async def get_snapshot(filename: str):
+async def get_snapshot(filename: str, annotated: bool = False):
     from fastapi.responses import FileResponse
     import os
-    filepath = os.path.join("snapshots", filename)
+    filepath = os.path.join("snapshots", os.path.basename(filename))
+    if not os.path.exists(filepath):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+    # Snapshots are stored clean; overlays are drawn on request
+    sidecar = filepath + ".json"
+    if annotated and os.path.exists(sidecar):
+        with open(sidecar) as fh:
+            boxes = json.load(fh).get("boxes", [])
+        img = cv2.imread(filepath)
+        if img is not None:
+            _, jpg = cv2.imencode(".jpg", draw_overlay(img, boxes))
+            return Response(content=jpg.tobytes(), media_type="image/jpeg")
+    return FileResponse(filepath, media_type="image/jpeg")
+
+@app.get("/clips/{filename}")
+async def get_clip(filename: str):
+    from fastapi.responses import FileResponse
+    import os
+    filepath = os.path.join(settings.recording_dir, os.path.basename(filename))
     if os.path.exists(filepath):
-        return FileResponse(filepath, media_type="image/jpeg")
-    raise HTTPException(status_code=404, detail="Snapshot not found")
+        return FileResponse(filepath, media_type="video/x-msvideo")
+    raise HTTPException(status_code=404, detail="Clip not found")
 
 # --------------- ADD PERSON ----------------
 
@@ -194,7 +265,10 @@ async def get_snapshot(filename: str):
 async def add_person(name: str, file: UploadFile):
     img = cv2.imdecode(np.frombuffer(await file.read(), np.uint8), cv2.IMREAD_COLOR)
 
-    emb = extract_face_embedding(img)
+    try:
+        emb = extract_face_embedding(img)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if emb is None:
         raise HTTPException(status_code=400, detail="No face found")
 
@@ -210,26 +284,44 @@ def camera_stream_legacy(url: str):
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+def start_camera(cam: dict):
+    """Start a worker for a camera this node now owns; False if it can't yet"""
+    cam_id = camera_registry.camera_key(cam)
+    # Get url from either url or rtsp_url field
+    url = cam.get("url") or cam.get("rtsp_url")
+    if not url:
+        return False
+    if cam_id in active_workers:
+        return True
+    # A worker stopped after a lost lease may still be inside cap.read(); two
+    # workers would capture twice and share one recording buffer
+    previous = stopping_workers.get(cam_id)
+    if previous is not None and previous.is_alive():
+        return False
+    stopping_workers.pop(cam_id, None)
+    worker = CameraWorker(cam_id, url, broadcast_alert)
+    active_workers[cam_id] = worker
+    worker.start()
+    return True
+
+def stop_camera(cam_id: str):
+    """Stop the worker for a camera this node no longer owns"""
+    worker = active_workers.pop(cam_id, None)
+    if worker:
+        worker.running = False
+        stopping_workers[cam_id] = worker
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize cameras on startup"""
-    try:
-        cameras = get_all_cameras()
-        for cam in cameras:
-            cam_id = str(cam.get("id", cam.get("name", "unknown")))
-            # Get url from either url or rtsp_url field
-            url = cam.get("url") or cam.get("rtsp_url")
-            if url:
-                if cam_id not in active_workers:
-                    worker = CameraWorker(cam_id, url, broadcast_alert)
-                    active_workers[cam_id] = worker
-                    worker.start()
-    except Exception as e:
-        print(f"Error initializing cameras: {e}")
+    """Join the cluster; cameras are loaded (and retried) by its lease loop and
+    workers start as camera leases are acquired"""
+    recorder.start()
+    await cluster.start(active_workers, start_camera, stop_camera, deliver_alert)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Stop all camera workers on shutdown"""
+    await cluster.stop()
     for worker in active_workers.values():
         worker.running = False
     active_workers.clear()
@@ -1,50 +1,167 @@
 import asyncio
+import time
 import cv2
 import numpy as np
 from collections import defaultdict
+from .config import settings
 
 _latest = defaultdict(lambda: None)
+_viewers = defaultdict(int)
+
+# Annotation metadata per camera. The processed frame is only kept while
+# someone wants the annotated view, and is rendered at most once per overlay.
+_frame_seq = defaultdict(int)
+_overlays = {}
+_processed = {}
+_annotated = {}
+_annotated_viewers = defaultdict(int)
+remote_annotated = set()
 
 def update_frame(camera_id: str, frame):
-    """Update the latest frame for a camera"""
+    """Update the latest frame for a camera and return the encoded JPEG"""
     try:
         _, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
         _latest[camera_id] = jpg.tobytes()
+        _frame_seq[camera_id] += 1
+        return _latest[camera_id]
     except Exception as e:
         print(f"Error encoding frame for {camera_id}: {e}")
+        return None
+
+def wants_annotated(camera_id: str):
+    """Whether a local or remote viewer is watching the annotated stream"""
+    return _annotated_viewers.get(camera_id, 0) > 0 or camera_id in remote_annotated
+
+def update_overlay(camera_id: str, boxes: list, frame=None):
+    """Replace the annotation boxes for a camera from its latest processed frame.
+
+    Each box is a dict with ``bbox`` as [x1, y1, x2, y2] and an optional ``label``.
+    """
+    overlay = {
+        "camera_id": camera_id,
+        "version": _overlays.get(camera_id, {}).get("version", 0) + 1,
+        "seq": _frame_seq[camera_id],
+        "timestamp": time.time(),
+        "boxes": boxes,
+    }
+    if frame is not None:
+        overlay["width"], overlay["height"] = int(frame.shape[1]), int(frame.shape[0])
+    _overlays[camera_id] = overlay
+
+    if boxes and frame is not None and wants_annotated(camera_id):
+        _processed[camera_id] = (overlay["version"], frame)
+    else:
+        _processed.pop(camera_id, None)
+
+def get_overlay(camera_id: str):
+    """Current overlay for a camera, or None once it is older than overlay_ttl_seconds"""
+    overlay = _overlays.get(camera_id)
+    if overlay is None or time.time() - overlay["timestamp"] > settings.overlay_ttl_seconds:
+        return None
+    return overlay
+
+def draw_overlay(frame, boxes):
+    """Draw annotation boxes onto a copy of a frame"""
+    out = frame.copy()
+    for box in boxes:
+        x1, y1, x2, y2 = box["bbox"]
+        cv2.rectangle(out, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        if box.get("label"):
+            cv2.putText(
+                out,
+                box["label"],
+                (x1, max(y1 - 10, 20)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.7,
+                (0, 255, 0),
+                2
+            )
+    return out
+
+def annotated_frame(camera_id: str):
+    """Latest JPEG, with overlays drawn when it is the frame they were detected on.
+
+    The annotated JPEG is rendered once per overlay version and reused; other
+    frames are served as the raw JPEG already encoded by ``update_frame``.
+    """
+    overlay = _overlays.get(camera_id)
+    if overlay is None or not overlay["boxes"] or overlay["seq"] != _frame_seq[camera_id]:
+        return _latest.get(camera_id)
 
-async def mjpeg_stream_generator(camera_id: str):
-    """Generate MJPEG stream for a camera"""
+    cached = _annotated.get(camera_id)
+    if cached and cached[0] == overlay["version"]:
+        return cached[1]
+    processed = _processed.pop(camera_id, None)
+    if processed is None or processed[0] != overlay["version"]:
+        return _latest.get(camera_id)
+    try:
+        _, jpg = cv2.imencode(".jpg", draw_overlay(processed[1], overlay["boxes"]), [cv2.IMWRITE_JPEG_QUALITY, 85])
+    except Exception as e:
+        print(f"Error rendering overlay for {camera_id}: {e}")
+        return _latest.get(camera_id)
+    _annotated[camera_id] = (overlay["version"], jpg.tobytes())
+    return _annotated[camera_id][1]
+
+def latest_frame(camera_id: str):
+    """Latest raw JPEG for a camera"""
+    return _latest.get(camera_id)
+
+def viewer_count(camera_id: str):
+    """Number of clients currently streaming a camera from this node"""
+    return _viewers.get(camera_id, 0)
+
+def viewer_counts():
+    """Cameras with clients streaming from this node, and how many"""
+    return {camera_id: n for camera_id, n in _viewers.items() if n > 0}
+
+async def mjpeg_stream_generator(camera_id: str, annotated: bool = False, source=None):
+    """Generate MJPEG stream for a camera, optionally with overlays drawn in.
+
+    ``source`` overrides where frames come from, e.g. frames relayed from another node.
+    """
     boundary = b"--frame"
     no_frame_count = 0
     
-    while True:
-        frame = _latest.get(camera_id)
-        if frame:
-            no_frame_count = 0
-            yield (
-                boundary
-                + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
-                + str(len(frame)).encode()
-                + b"\r\n\r\n"
-                + frame
-                + b"\r\n"
-            )
-            await asyncio.sleep(0.033)  # ~30 FPS
-        else:
-            no_frame_count += 1
-            # If no frame for 5 seconds, create placeholder
-            if no_frame_count > 150:
-                placeholder = create_placeholder_frame(camera_id)
+    _viewers[camera_id] += 1
+    if annotated and source is None:
+        _annotated_viewers[camera_id] += 1
+    try:
+        while True:
+            if source is not None:
+                frame = source()
+            elif annotated:
+                frame = await asyncio.to_thread(annotated_frame, camera_id)
+            else:
+                frame = _latest.get(camera_id)
+            if frame:
+                no_frame_count = 0
                 yield (
                     boundary
                     + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
-                    + str(len(placeholder)).encode()
+                    + str(len(frame)).encode()
                     + b"\r\n\r\n"
-                    + placeholder
+                    + frame
                     + b"\r\n"
                 )
-            await asyncio.sleep(0.1)
+                await asyncio.sleep(0.033)  # ~30 FPS
+            else:
+                no_frame_count += 1
+                # If no frame for 5 seconds, create placeholder
+                if no_frame_count > 150:
+                    placeholder = create_placeholder_frame(camera_id)
+                    yield (
+                        boundary
+                        + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                        + str(len(placeholder)).encode()
+                        + b"\r\n\r\n"
+                        + placeholder
+                        + b"\r\n"
+                    )
+                await asyncio.sleep(0.1)
+    finally:
+        _viewers[camera_id] -= 1
+        if annotated and source is None:
+            _annotated_viewers[camera_id] -= 1
 
 def create_placeholder_frame(camera_id: str):
     """Create a placeholder frame when camera is not available"""
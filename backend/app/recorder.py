@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import cv2
+import numpy as np
+from .config import settings
+
+# Pre-event buffers hold the JPEG bytes the MJPEG stream already encoded, so
+# recording costs no extra encode. Clip frames are streamed to disk by a single
+# background thread as they arrive. Ring frames and clip frames not yet written
+# are charged to one recording_memory_mb budget; clip frames over it are dropped.
+
+
+class FrameRing:
+    """Bounded buffer of recent JPEG frames for one camera"""
+
+    def __init__(self):
+        self.frames = deque()
+        self.bytes = 0
+        self.last_push = 0.0
+
+    def push(self, ts: float, jpg: bytes, max_bytes: int):
+        self.frames.append((ts, jpg))
+        self.bytes += len(jpg)
+        horizon = ts - settings.recording_pre_seconds
+        while self.frames and (self.bytes > max_bytes or self.frames[0][0] < horizon):
+            _, old = self.frames.popleft()
+            self.bytes -= len(old)
+
+    def since(self, ts: float):
+        return [f for f in self.frames if f[0] >= ts]
+
+
+_rings = {}
+_pending = {}
+_closing = []
+_clip_bytes = 0
+_lock = threading.Lock()
+_writer = None
+
+RETENTION_INTERVAL = 60.0
+
+
+def _budget_bytes():
+    return settings.recording_memory_mb * 1024 * 1024
+
+
+def _charge(clip, ts: float, jpg: bytes):
+    """Add a frame to a clip if the memory budget allows it"""
+    global _clip_bytes
+    if _clip_bytes + len(jpg) > _budget_bytes():
+        clip["dropped"] += 1
+        return
+    clip["frames"].append((ts, jpg))
+    _clip_bytes += len(jpg)
+
+
+def push_frame(camera_id: str, jpg: bytes, ts: float = None):
+    """Buffer an encoded frame, sampled down to the recording frame rate"""
+    if not settings.recording_enabled or not jpg:
+        return
+    ts = ts or time.time()
+    with _lock:
+        ring = _rings.get(camera_id)
+        if ring is None:
+            ring = _rings[camera_id] = FrameRing()
+        if ts - ring.last_push < 1.0 / settings.recording_fps:
+            return
+        ring.last_push = ts
+        # Rings share whatever the recording clips are not using
+        ring_cap = max(_budget_bytes() - _clip_bytes, 0) // max(len(_rings), 1)
+        ring.push(ts, jpg, ring_cap)
+
+        clip = _pending.get(camera_id)
+        if clip:
+            _charge(clip, ts, jpg)
+            if ts >= clip["end"]:
+                _closing.append(_pending.pop(camera_id))
+
+
+def request_clip(camera_id: str, ts: float = None):
+    """Start (or extend) a clip around an event and return its filename.
+
+    The file is written asynchronously as frames arrive and completed once the
+    post-event window has passed. Events that land while a clip is still
+    recording extend that clip, up to ``recording_max_clip_seconds``.
+    """
+    if not settings.recording_enabled:
+        return None
+    ts = ts or time.time()
+    with _lock:
+        clip = _pending.get(camera_id)
+        if clip:
+            limit = clip["start"] + settings.recording_max_clip_seconds
+            clip["end"] = min(max(clip["end"], ts + settings.recording_post_seconds), limit)
+            return clip["filename"]
+
+        start = ts - settings.recording_pre_seconds
+        stamp = datetime.fromtimestamp(ts).strftime("%Y%m%d_%H%M%S_%f")
+        clip = {
+            "camera_id": camera_id,
+            "filename": f"{camera_id}_{stamp}.avi",
+            "start": start,
+            "end": ts + settings.recording_post_seconds,
+            "frames": [],
+            "dropped": 0,
+            "writer": None,
+            "size": None,
+            "next_ts": None,
+            "last": None,
+        }
+        ring = _rings.get(camera_id)
+        for ts_frame, jpg in (ring.since(start) if ring else []):
+            _charge(clip, ts_frame, jpg)
+        _pending[camera_id] = clip
+    return clip["filename"]
+
+
+def drop_camera(camera_id: str):
+    """Release a camera's buffer and finish any clip still recording"""
+    with _lock:
+        _rings.pop(camera_id, None)
+        clip = _pending.pop(camera_id, None)
+        if clip:
+            _closing.append(clip)
+
+
+def start():
+    """Start the clip writer; it also prunes old clips on a timer"""
+    global _writer
+    if not settings.recording_enabled:
+        return
+    with _lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, daemon=True)
+            _writer.start()
+
+
+def _close_stale():
+    """Finish clips whose camera stopped delivering frames"""
+    grace = 2.0 / settings.recording_fps + 1.0
+    now = time.time()
+    for camera_id in [c for c, clip in _pending.items() if now > clip["end"] + grace]:
+        _closing.append(_pending.pop(camera_id))
+
+
+def _writer_loop():
+    last_retention = 0.0
+    while True:
+        if time.time() - last_retention > RETENTION_INTERVAL:
+            last_retention = time.time()
+            try:
+                _enforce_retention()
+            except Exception as e:
+                print(f"Error pruning clips: {e}")
+        if not _drain():
+            time.sleep(0.2)
+
+
+def _drain():
+    """Write buffered frames of every open clip; returns True if there was work"""
+    global _clip_bytes
+    with _lock:
+        _close_stale()
+        work = []
+        for clip in _pending.values():
+            if clip["frames"]:
+                work.append((clip, clip["frames"], False))
+                clip["frames"] = []
+        for clip in _closing:
+            work.append((clip, clip["frames"], True))
+            clip["frames"] = []
+        _closing.clear()
+
+    for clip, frames, finished in work:
+        try:
+            _write_frames(clip, frames)
+        except Exception as e:
+            print(f"Error writing clip {clip['filename']}: {e}")
+        with _lock:
+            _clip_bytes -= sum(len(jpg) for _, jpg in frames)
+        if finished:
+            try:
+                _finish_clip(clip)
+            except Exception as e:
+                print(f"Error finishing clip {clip['filename']}: {e}")
+    return bool(work)
+
+
+def _write_frames(clip, frames):
+    """Write frames at a constant recording_fps, placed by their capture time.
+
+    Frames that arrive slower than the writer's rate (slow cameras, detection
+    stalls, failed reads) are padded by repeating the previous frame, so the
+    clip plays back in real time.
+    """
+    step = 1.0 / settings.recording_fps
+    for ts, jpg in frames:
+        # Capture is rate-capped, so a frame ahead of its slot is only jitter
+        if clip["writer"] is not None and ts + step / 2 < clip["next_ts"]:
+            continue
+        img = cv2.imdecode(np.frombuffer(jpg, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        if clip["writer"] is None:
+            os.makedirs(settings.recording_dir, exist_ok=True)
+            clip["size"] = (img.shape[1], img.shape[0])
+            clip["next_ts"] = ts
+            fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+            clip["writer"] = cv2.VideoWriter(
+                _part_path(clip), fourcc, settings.recording_fps, clip["size"]
+            )
+        elif (img.shape[1], img.shape[0]) != clip["size"]:
+            img = cv2.resize(img, clip["size"])
+
+        while clip["last"] is not None and clip["next_ts"] + step / 2 < ts:
+            clip["writer"].write(clip["last"])
+            clip["next_ts"] += step
+        clip["writer"].write(img)
+        clip["next_ts"] += step
+        clip["last"] = img
+
+
+def _part_path(clip):
+    return os.path.join(settings.recording_dir, clip["filename"][:-4] + ".part.avi")
+
+
+def _finish_clip(clip):
+    clip["last"] = None
+    if clip["writer"] is None:
+        return
+    clip["writer"].release()
+    os.replace(_part_path(clip), os.path.join(settings.recording_dir, clip["filename"]))
+    if clip["dropped"]:
+        print(f"Clip {clip['filename']} dropped {clip['dropped']} frames over the memory budget")
+
+
+def _enforce_retention():
+    """Delete clips past the retention window, then oldest first over the disk cap"""
+    clip_dir = settings.recording_dir
+    if not os.path.isdir(clip_dir):
+        return
+    now = time.time()
+    max_age = settings.recording_retention_hours * 3600
+    clips = []
+    for name in os.listdir(clip_dir):
+        if not name.endswith(".avi") or name.endswith(".part.avi"):
+            continue
+        path = os.path.join(clip_dir, name)
+        st = os.stat(path)
+        if now - st.st_mtime > max_age:
+            os.remove(path)
+        else:
+            clips.append((st.st_mtime, st.st_size, path))
+
+    total = sum(c[1] for c in clips)
+    max_bytes = settings.recording_max_disk_mb * 1024 * 1024
+    for _, size, path in sorted(clips):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
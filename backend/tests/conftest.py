@@ -0,0 +1,41 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The cluster tests never talk to Supabase; cameras come from this list instead
+CAMERAS = []
+
+
+def _normalize_camera(camera):
+    if "rtsp_url" in camera:
+        camera["url"] = camera["rtsp_url"]
+    return camera
+
+
+fake_db = types.ModuleType("app.db")
+fake_db.get_all_cameras = lambda: [dict(c) for c in CAMERAS]
+fake_db.normalize_camera = _normalize_camera
+sys.modules["app.db"] = fake_db
+
+
+@pytest.fixture
+def cluster(monkeypatch):
+    """Fresh cluster state with short leases, backed by an in-process LocalBus"""
+    from app.config import settings
+    from app import camera_registry, mjpeg, cluster as cluster_module
+
+    monkeypatch.setattr(settings, "cluster_url", "")
+    monkeypatch.setattr(settings, "node_id", "node-a")
+    monkeypatch.setattr(settings, "lease_ttl_seconds", 0.6)
+    monkeypatch.setattr(settings, "lease_interval_seconds", 0.05)
+    CAMERAS[:] = [{"id": f"cam{i}", "rtsp_url": f"rtsp://cam{i}"} for i in range(4)]
+
+    importlib.reload(mjpeg)
+    importlib.reload(camera_registry)
+    yield importlib.reload(cluster_module)
+    CAMERAS.clear()
@@ -0,0 +1,141 @@
+import asyncio
+
+from app.bus import LocalBus
+
+
+class Hooks:
+    """Fake camera worker hooks recording what the cluster asked for"""
+
+    def __init__(self):
+        self.running = set()
+        self.stopped = []
+        self.alerts = []
+
+    def start_camera(self, cam):
+        self.running.add(cam["id"])
+        return True
+
+    def stop_camera(self, camera_id):
+        self.running.discard(camera_id)
+        self.stopped.append(camera_id)
+
+    async def deliver_alert(self, alert):
+        self.alerts.append(alert)
+
+
+class YieldingBus(LocalBus):
+    """LocalBus whose subscribe yields to the event loop, like a network round trip"""
+
+    async def subscribe(self, channel, callback):
+        await asyncio.sleep(0.01)
+        await super().subscribe(channel, callback)
+
+
+async def start(cluster, hooks):
+    await cluster.start({}, hooks.start_camera, hooks.stop_camera, hooks.deliver_alert)
+    await asyncio.sleep(0.15)
+
+
+def test_local_bus_lease_renew_and_expiry():
+    async def scenario():
+        bus = LocalBus()
+        assert await bus.acquire("cam0", "node-a", 0.1)
+        assert not await bus.acquire("cam0", "node-b", 0.1)
+        assert await bus.acquire("cam0", "node-a", 0.1)
+        await asyncio.sleep(0.15)
+        assert await bus.acquire("cam0", "node-b", 0.1)
+        await bus.release("cam0", "node-a")
+        assert not await bus.acquire("cam0", "node-a", 0.1)
+
+    asyncio.run(scenario())
+
+
+def test_single_node_claims_every_camera(cluster):
+    async def scenario():
+        hooks = Hooks()
+        await start(cluster, hooks)
+        assert hooks.running == {"cam0", "cam1", "cam2", "cam3"}
+        assert all(cluster.is_local(c) for c in hooks.running)
+
+        cluster.publish_alert({"camera_id": "cam0"})
+        await asyncio.sleep(0.05)
+        assert hooks.alerts == [{"camera_id": "cam0"}]
+        await cluster.stop()
+        assert hooks.running == set()
+
+    asyncio.run(scenario())
+
+
+def test_sheds_cameras_when_a_node_joins(cluster):
+    async def scenario():
+        hooks = Hooks()
+        await start(cluster, hooks)
+        assert len(hooks.running) == 4
+
+        await cluster.bus.heartbeat("node-b", 10)
+        await asyncio.sleep(0.3)
+        assert len(hooks.running) == 2
+        assert len(hooks.stopped) == 2
+        await cluster.stop()
+
+    asyncio.run(scenario())
+
+
+def test_takes_over_camera_after_owner_lease_expires(cluster):
+    async def scenario():
+        hooks = Hooks()
+        # A dead node still holds cam0 until its lease runs out
+        bus = LocalBus()
+        await bus.acquire("cam0", "node-dead", 0.4)
+        cluster.create_bus = lambda url: bus
+        await start(cluster, hooks)
+        assert "cam0" not in hooks.running
+        assert len(hooks.running) == 3
+
+        await asyncio.sleep(0.4)
+        assert "cam0" in hooks.running
+        await cluster.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stops_cameras_when_leases_cannot_be_renewed(cluster):
+    async def scenario():
+        hooks = Hooks()
+        await start(cluster, hooks)
+        assert len(hooks.running) == 4
+
+        async def unreachable(*args, **kwargs):
+            raise ConnectionError("bus unreachable")
+
+        cluster.bus.acquire = unreachable
+        cluster.bus.heartbeat = unreachable
+        # Stopped before the 0.6s lease could be claimed by another node
+        await asyncio.sleep(0.6)
+        assert hooks.running == set()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_remote_viewers_share_one_subscription(cluster):
+    async def scenario():
+        bus = cluster.bus = YieldingBus()
+        channel = cluster.frame_channel("cam1", False)
+        viewers = [cluster.remote_stream("cam1", False) for _ in range(2)]
+        firsts = [asyncio.ensure_future(v.__anext__()) for v in viewers]
+
+        for _ in range(20):
+            await bus.publish(channel, b"jpeg")
+            await asyncio.sleep(0.01)
+            if all(f.done() for f in firsts):
+                break
+        assert all(b"jpeg" in f.result() for f in firsts)
+        assert (await bus.subscriber_counts([channel]))[channel] == 1
+
+        for v in viewers:
+            await v.aclose()
+        assert (await bus.subscriber_counts([channel]))[channel] == 0
+        assert not cluster._watchers
+        assert not cluster._watch_callbacks
+
+    asyncio.run(scenario())
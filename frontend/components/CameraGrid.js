@@ -1,4 +1,49 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
+
+const BACKEND = process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8000";
+
+// Face boxes pushed by the backend; drawn over the raw stream instead of into it
+function CameraOverlay({ camId, className }) {
+  const [overlay, setOverlay] = useState(null);
+
+  useEffect(() => {
+    const wsUrl = `${BACKEND.replace("http://", "ws://").replace("https://", "wss://")}/ws/overlays/${camId}`;
+    const socket = new WebSocket(wsUrl);
+    socket.onmessage = (event) => {
+      try {
+        const message = JSON.parse(event.data);
+        if (message.type === "overlay") setOverlay(message.data);
+      } catch (err) {
+        console.error("Bad overlay message:", err);
+      }
+    };
+    return () => socket.close();
+  }, [camId]);
+
+  if (!overlay || !overlay.boxes?.length || !overlay.width) return null;
+
+  return (
+    <svg
+      className={`absolute inset-0 w-full h-full pointer-events-none ${className || ""}`}
+      viewBox={`0 0 ${overlay.width} ${overlay.height}`}
+      preserveAspectRatio="xMidYMid meet"
+    >
+      {overlay.boxes.map((box, i) => {
+        const [x1, y1, x2, y2] = box.bbox;
+        return (
+          <g key={i}>
+            <rect x={x1} y={y1} width={x2 - x1} height={y2 - y1} fill="none" stroke="#00ff00" strokeWidth={2} />
+            {box.label && (
+              <text x={x1} y={Math.max(y1 - 10, 20)} fill="#00ff00" fontSize={20}>
+                {box.label}
+              </text>
+            )}
+          </g>
+        );
+      })}
+    </svg>
+  );
+}
 
 export default function CameraGrid({ cameras, token }) {
   const [fullscreen, setFullscreen] = useState(null);
@@ -14,8 +59,7 @@ export default function CameraGrid({ cameras, token }) {
   }
 
   const streamUrl = (camId) => {
-    const baseUrl = process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8000";
-    return `${baseUrl}/stream/${camId}?t=${Date.now()}`; // Add timestamp to prevent caching
+    return `${BACKEND}/stream/${camId}?t=${Date.now()}`; // Add timestamp to prevent caching
   };
 
   return (
@@ -56,6 +100,7 @@ export default function CameraGrid({ cameras, token }) {
                       e.target.src = `data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='640' height='480'%3E%3Crect fill='%23111111' width='640' height='480'/%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' fill='%23666' font-size='20'%3EWaiting for feed...%3C/text%3E%3C/svg%3E`;
                     }}
                   />
+                  <CameraOverlay camId={camId} className="transition-transform duration-300 group-hover:scale-105" />
                   <div className="absolute inset-0 bg-gradient-to-t from-black/50 to-transparent opacity-0 group-hover:opacity-100 transition-opacity"></div>
                 </div>
               </div>
@@ -85,6 +130,7 @@ export default function CameraGrid({ cameras, token }) {
               className="w-full h-full object-contain"
               onClick={(e) => e.stopPropagation()}
             />
+            <CameraOverlay camId={fullscreen} />
           </div>
         </div>
       )}
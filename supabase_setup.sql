@@ -48,10 +48,14 @@ CREATE TABLE IF NOT EXISTS detections (
     timestamp TIMESTAMPTZ,
     confidence NUMERIC,
     snapshot_path TEXT,
+    clip_path TEXT,
     raw_metadata JSONB,
     created_at TIMESTAMPTZ DEFAULT now()
 );
 
+-- Existing databases created before event clips were recorded
+ALTER TABLE detections ADD COLUMN IF NOT EXISTS clip_path TEXT;
+
 CREATE INDEX IF NOT EXISTS idx_detections_person ON detections(person_id);
 CREATE INDEX IF NOT EXISTS idx_detections_camera ON detections(camera_id);
 CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections(timestamp);